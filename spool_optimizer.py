@@ -1,36 +1,557 @@
 import argparse
+import io
 import logging
+import mmap
 import os
+import queue
+import stat
 import sys
+import threading
 import time
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing, contextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import Tuple
+from typing import Dict, Generator, Iterable, Iterator, NamedTuple, Optional, Tuple
 
 import fitz
+from PIL import Image
+
+try:
+    import pyvips
+except (ImportError, OSError):  # optional; pyvips is missing or libvips cannot be loaded
+    pyvips = None
+
+try:
+    import deflate
+except ImportError:  # optional; only needed for --libdeflate
+    deflate = None
+
+# JPEG encoders selectable with --encoder.
+ENCODERS = ("pillow", "vips", "mupdf")
+# Output modes selectable with --mode: 8-bit grayscale JPEG, or 1-bit dithered
+# CCITT Group 4 for text-only notes.
+MODES = ("gray", "bilevel")
+
+# Source document (and its backing memory map) and rendering settings set up
+# once per worker process by ``_init_worker``.
+_SRC_MAP: Optional[mmap.mmap] = None
+_SRC_DOC: Optional[fitz.Document] = None
+_OPTIONS: Optional["_RenderOptions"] = None
+_PAGES_RENDERED = 0
+
+# (image_stream, image_width, image_height, page_width, page_height)
+RenderedPage = Tuple[bytes, int, int, float, float]
+
+# Image XObject dictionary for a rendered page. /Filter and /DecodeParms are
+# set after the stream is written because writing an uncompressed stream drops
+# them.
+_IMAGE_XOBJECT = (
+    "<</Type/XObject/Subtype/Image/Width {width}/Height {height}"
+    "/ColorSpace/DeviceGray/BitsPerComponent {bpc}>>"
+)
+# Per output mode: (BitsPerComponent, Filter, DecodeParms template or None).
+# Pillow writes Group 4 data as BlackIsZero, hence /BlackIs1 true.
+_IMAGE_FILTERS = {
+    "gray": (8, "/DCTDecode", None),
+    "bilevel": (1, "/CCITTFaxDecode", "<</K -1/Columns {width}/Rows {height}/BlackIs1 true>>"),
+}
+
+# --adaptive-dpi: text-only pages are rendered at ADAPTIVE_TEXT_DPI; pages whose
+# images cover more than ADAPTIVE_IMAGE_COVERAGE of the page keep the full DPI.
+ADAPTIVE_TEXT_DPI = 72
+ADAPTIVE_TEXT_SHARE = 0.95
+ADAPTIVE_IMAGE_COVERAGE = 0.30
+
+# A page that is one upright grayscale JPEG covering at least this share of the
+# page is passed through without re-rendering, unless the scan's resolution is
+# more than PASSTHROUGH_MAX_DPI_RATIO times the requested DPI.
+PASSTHROUGH_MIN_COVERAGE = 0.99
+PASSTHROUGH_MAX_DPI_RATIO = 1.1
+
+# MuPDF's resource store (decoded images, fonts) is emptied every this many
+# rendered pages so that memory stays flat on large documents.
+STORE_FLUSH_INTERVAL = 32
+
+# TIFF tags used to locate the Group 4 strip written by Pillow.
+_TIFF_STRIP_OFFSETS = 273
+_TIFF_STRIP_BYTE_COUNTS = 279
+
+
+class _RenderOptions(NamedTuple):
+    """Per-document rendering settings shipped to the worker processes."""
+
+    dpi: int
+    jpeg_quality: int
+    encoder: str
+    mode: str
+    adaptive_dpi: bool
+
+
+def _map_file(path: str) -> mmap.mmap:
+    """Memory-map a file read-only.
 
+    Args:
+        path: Path of the file to map.
+
+    Returns:
+        A read-only memory map over the whole file.
+
+    Raises:
+        fitz.EmptyFileError: If the file is empty and therefore cannot be mapped.
+        fitz.FileDataError: If the path is not a regular file or cannot be read.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    except PermissionError as e:
+        raise fitz.FileDataError(f"Cannot open '{path}': {e.strerror}") from e
+    try:
+        st = os.fstat(fd)
+        if not stat.S_ISREG(st.st_mode):
+            raise fitz.FileDataError(f"'{path}' is no file")
+        if st.st_size == 0:
+            raise fitz.EmptyFileError(f"Cannot open empty file: {path}")
+        if os.name == "nt":
+            return mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        return mmap.mmap(fd, 0, prot=mmap.PROT_READ)
+    finally:
+        # The mapping holds its own reference to the file
+        os.close(fd)
+
+
+@contextmanager
+def _open_mapped(path: Path) -> Iterator[fitz.Document]:
+    """Open a PDF that MuPDF parses directly from a memory map of the file.
+
+    Pages are demand-paged from the page cache instead of being read through
+    intermediate buffers. The document and the mapping are released on exit.
+
+    Args:
+        path: Path to the PDF file.
+
+    Yields:
+        The opened source document.
+    """
+    mm = _map_file(str(path))
+    if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+        # Pages are rendered front to back
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+    view = memoryview(mm)
+    doc = None
+    try:
+        doc = fitz.open(stream=view, filetype="pdf")
+        yield doc
+    finally:
+        if doc is not None:
+            doc.close()
+        view.release()
+        mm.close()
+
+
+def _init_worker(pdf_path_str: str, options: _RenderOptions) -> None:
+    """Open the source PDF once for the lifetime of a worker process.
+
+    Used as the ``initializer`` of the process pool so that the xref table is
+    parsed once per worker instead of once per rendered page, and so that
+    tasks only need to carry a page number. The file is memory-mapped so that
+    all workers share the same page-cache pages.
+
+    Args:
+        pdf_path_str: Absolute path to the source PDF.
+        options: Rendering settings for every page of the document.
+    """
+    global _SRC_MAP, _SRC_DOC, _OPTIONS
+    _SRC_MAP = _map_file(pdf_path_str)
+    _SRC_DOC = fitz.open(stream=memoryview(_SRC_MAP), filetype="pdf")
+    _OPTIONS = options
+
+
+def _encode_jpeg(pix: fitz.Pixmap, quality: int, encoder: str) -> bytes:
+    """Encode a grayscale pixmap as a baseline JPEG.
+
+    The Huffman optimize pass is only worth its cost at higher qualities.
+    Progressive encoding is deliberately not used. Pixel data is handed to the
+    encoder as ``pix.samples_mv``, a view of MuPDF's buffer, rather than
+    ``pix.samples``, which would copy it; the encoder's image object must not
+    outlive ``pix``.
+
+    Args:
+        pix: Grayscale pixmap without alpha.
+        quality: JPEG quality (1-95).
+        encoder: One of ``ENCODERS``. ``"vips"`` uses libvips' libjpeg-turbo
+                 encoder and requires pyvips; ``"mupdf"`` uses MuPDF's own.
+
+    Returns:
+        The encoded JPEG bytes.
+    """
+    if encoder == "vips":
+        img = pyvips.Image.new_from_memory(pix.samples_mv, pix.width, pix.height, 1, "uchar")
+        return img.jpegsave_buffer(Q=quality, strip=True, optimize_coding=quality >= 70, interlace=False)
+    if encoder == "mupdf":
+        return pix.tobytes("jpeg", jpg_quality=quality)
+
+    img = Image.frombuffer("L", (pix.width, pix.height), pix.samples_mv, "raw", "L", 0, 1)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=quality, optimize=quality >= 70)
+    return buf.getvalue()
+
+
+def _encode_g4(pix: fitz.Pixmap) -> bytes:
+    """Dither a grayscale pixmap to 1 bit and encode it as CCITT Group 4.
+
+    Pillow's Floyd-Steinberg dither and libtiff's Group 4 codec do the work.
+    The page is written as a single TIFF strip whose data is exactly the
+    ``/CCITTFaxDecode`` stream with ``/K -1``.
+
+    Args:
+        pix: Grayscale pixmap without alpha.
+
+    Returns:
+        The raw Group 4 encoded bitmap.
+    """
+    img = Image.frombuffer("L", (pix.width, pix.height), pix.samples_mv, "raw", "L", 0, 1)
+    buf = io.BytesIO()
+    img.convert("1", dither=Image.Dither.FLOYDSTEINBERG).save(
+        buf, "TIFF", compression="group4", strip_size=2**31 - 1
+    )
+    buf.seek(0)
+    with Image.open(buf) as tif:
+        offsets = tif.tag_v2[_TIFF_STRIP_OFFSETS]
+        lengths = tif.tag_v2[_TIFF_STRIP_BYTE_COUNTS]
+    # Each strip is coded from a fresh reference line, so strips cannot simply
+    # be concatenated; a Pillow that ignores strip_size must not truncate pages
+    if len(offsets) != 1:
+        raise RuntimeError(
+            f"Pillow wrote {len(offsets)} TIFF strips instead of one; Group 4 output needs Pillow >= 10.2"
+        )
+    offset, length = offsets[0], lengths[0]
+    return buf.getvalue()[offset:offset + length]
+
+
+def _encode_page(pix: fitz.Pixmap, options: _RenderOptions) -> bytes:
+    """Encode a rendered pixmap according to the output mode.
+
+    Args:
+        pix: Grayscale pixmap without alpha.
+        options: Rendering settings.
+
+    Returns:
+        The image stream for the page's Image XObject.
+    """
+    if options.mode == "bilevel":
+        return _encode_g4(pix)
+    return _encode_jpeg(pix, options.jpeg_quality, options.encoder)
+
+
+def _choose_dpi(page: fitz.Page, dpi: int) -> int:
+    """Pick the rasterization DPI for a page from the kind of content on it.
+
+    Uses the page's bbox log, a single cheap pass over the drawing operations,
+    to compare the area covered by visible text, images and vector graphics.
+    Pages that are almost entirely text are rendered at ``ADAPTIVE_TEXT_DPI``;
+    everything else keeps the requested DPI.
 
-def _render_page(args: Tuple[str, int, int]) -> Tuple[int, bytes, float, float]:
-    """Render a single PDF page to a grayscale JPEG in an isolated worker process.
+    Args:
+        page: The page about to be rendered.
+        dpi: The requested DPI.
+
+    Returns:
+        The DPI to render this page at.
+    """
+    if dpi <= ADAPTIVE_TEXT_DPI:
+        return dpi
+    # The bbox log is in unrotated page coordinates
+    page_rect = page.rect * page.derotation_matrix
+    text_area = image_area = graphics_area = 0.0
+    for kind, bbox in page.get_bboxlog():
+        area = (fitz.Rect(bbox) & page_rect).get_area()
+        if kind in ("fill-text", "stroke-text"):
+            text_area += area
+        elif kind in ("fill-image", "fill-imgmask"):
+            image_area += area
+        elif kind in ("fill-path", "stroke-path", "fill-shade"):
+            graphics_area += area
+    if image_area > ADAPTIVE_IMAGE_COVERAGE * page_rect.get_area():
+        return dpi
+    content_area = text_area + image_area + graphics_area
+    if content_area and text_area >= ADAPTIVE_TEXT_SHARE * content_area:
+        return ADAPTIVE_TEXT_DPI
+    return dpi
+
+
+@lru_cache(maxsize=None)
+def _dpi_matrix(dpi: int) -> fitz.Matrix:
+    """Return the (shared, read-only) scaling matrix for a DPI.
+
+    Passing a prebuilt matrix to ``get_pixmap`` skips rebuilding it from
+    ``dpi=`` on every page.
+
+    Args:
+        dpi: Rasterization resolution.
+
+    Returns:
+        The matrix scaling 72 DPI page space to ``dpi``.
+    """
+    zoom = dpi / 72.0
+    return fitz.Matrix(zoom, zoom)
+
+
+def _render_pixmap(page: fitz.Page, options: _RenderOptions) -> fitz.Pixmap:
+    """Render a page to a grayscale pixmap without alpha.
+
+    Args:
+        page: The page to render.
+        options: Rendering settings.
+
+    Returns:
+        The rendered pixmap.
+    """
+    dpi = _choose_dpi(page, options.dpi) if options.adaptive_dpi else options.dpi
+    return page.get_pixmap(matrix=_dpi_matrix(dpi), alpha=False, colorspace=fitz.csGRAY)
+
+
+def _maybe_passthrough(page: fitz.Page, options: _RenderOptions) -> Optional[RenderedPage]:
+    """Reuse a page's JPEG as-is when the page is nothing but a grayscale scan.
+
+    Rasterizing such a page and re-encoding it to JPEG costs a full render
+    and encode, and loses quality a second time. The existing image is kept
+    when it is the only visible content and is an upright, full-page, 8-bit
+    grayscale DCT image. It must also not be of much higher resolution than
+    requested, since re-rendering would then shrink it.
+
+    Args:
+        page: The page about to be rendered.
+        options: Rendering settings.
+
+    Returns:
+        The rendered-page tuple built from the existing JPEG, or None if the
+        page has to be rendered normally.
+    """
+    # A CropBox hides part of the scan, but the whole JPEG would be shown
+    if options.mode != "gray" or page.rotation or page.cropbox != page.mediabox:
+        return None
+    images = page.get_images(full=True)
+    if len(images) != 1:
+        return None
+    xref, smask, img_width, img_height, bpc, _, _, _, img_filter, _ = images[0]
+    if smask or bpc != 8 or img_filter != "DCTDecode":
+        return None
+    # Invisible OCR text is fine; anything else drawn on the page is not
+    if any(kind not in ("fill-image", "ignore-text") for kind, _ in page.get_bboxlog()):
+        return None
+    placements = page.get_image_rects(xref, transform=True)
+    if len(placements) != 1:
+        return None
+    bbox, matrix = placements[0]
+    rect = page.rect
+    if matrix.b or matrix.c or matrix.a <= 0 or matrix.d <= 0:
+        return None
+    # The image must fill the page without bleeding past its edges, or the
+    # cut-off parts would become visible in the output
+    if (bbox & rect).get_area() < PASSTHROUGH_MIN_COVERAGE * rect.get_area():
+        return None
+    if bbox.get_area() > rect.get_area() / PASSTHROUGH_MIN_COVERAGE:
+        return None
+    if img_width * 72 / bbox.width > PASSTHROUGH_MAX_DPI_RATIO * options.dpi:
+        return None
+    # The bbox log ignores clipping, so a clip path could hide part of the scan
+    min_area = PASSTHROUGH_MIN_COVERAGE * rect.get_area()
+    for item in page.get_drawings(extended=True):
+        if item["type"] == "clip" and (item["scissor"] & rect).get_area() < min_area:
+            return None
+    doc = page.parent
+    if doc.xref_get_key(xref, "Decode")[0] != "null" or doc.xref_get_key(xref, "Mask")[0] != "null":
+        return None
+    info = doc.extract_image(xref)
+    if info["ext"] != "jpeg" or info["colorspace"] != 1:
+        return None
+    return info["image"], img_width, img_height, rect.width, rect.height
+
+
+def _rasterize(page: fitz.Page, options: _RenderOptions) -> RenderedPage:
+    """Render a loaded page and encode it.
+
+    Args:
+        page: The page to render.
+        options: Rendering settings.
+
+    Returns:
+        Tuple of (image_stream, image_width, image_height, page_width, page_height).
+    """
+    passthrough = _maybe_passthrough(page, options)
+    if passthrough is not None:
+        return passthrough
+    pix = _render_pixmap(page, options)
+    rect = page.rect
+    return _encode_page(pix, options), pix.width, pix.height, rect.width, rect.height
+
+
+def _append_image_page(
+    out_doc: fitz.Document,
+    page: RenderedPage,
+    mode: str,
+    contents_cache: Dict[Tuple[float, float], int],
+) -> None:
+    """Append a page that shows a single full-page image.
+
+    The Image XObject is written directly instead of going through
+    ``Page.insert_image``, which would re-parse the image we just encoded. Pages
+    of the same size share one content stream.
+
+    Args:
+        out_doc: The output document being built.
+        page: The rendered page.
+        mode: Output mode the page was encoded with, one of ``MODES``.
+        contents_cache: Maps (page_width, page_height) to the xref of an
+                        existing content stream that draws ``/Im0`` full-page.
+    """
+    img_bytes, img_width, img_height, width, height = page
+    out_page = out_doc.new_page(width=width, height=height)
+
+    bpc, image_filter, decode_parms = _IMAGE_FILTERS[mode]
+    img_xref = out_doc.get_new_xref()
+    out_doc.update_object(img_xref, _IMAGE_XOBJECT.format(width=img_width, height=img_height, bpc=bpc))
+    out_doc.update_stream(img_xref, img_bytes, compress=False)
+    out_doc.xref_set_key(img_xref, "Filter", image_filter)
+    if decode_parms is not None:
+        out_doc.xref_set_key(img_xref, "DecodeParms", decode_parms.format(width=img_width, height=img_height))
+
+    contents_xref = contents_cache.get((width, height))
+    if contents_xref is None:
+        contents_xref = out_doc.get_new_xref()
+        out_doc.update_object(contents_xref, "<<>>")
+        out_doc.update_stream(contents_xref, f"q {width:g} 0 0 {height:g} 0 0 cm /Im0 Do Q".encode())
+        contents_cache[(width, height)] = contents_xref
+
+    out_doc.xref_set_key(out_page.xref, "Resources", f"<</XObject<</Im0 {img_xref} 0 R>>>>")
+    out_doc.xref_set_key(out_page.xref, "Contents", f"{contents_xref} 0 R")
+
+
+def _render_page(page_num: int) -> RenderedPage:
+    """Render and encode a single PDF page in a worker process.
 
     This function must live at module level so that multiprocessing can pickle it
-    when spawning worker processes on all platforms (including Windows).
+    when spawning worker processes on all platforms (including Windows). The
+    worker must have been set up by ``_init_worker``.
 
     Args:
-        args: Tuple of (pdf_path_str, page_num, dpi).
+        page_num: Zero-based index of the page to render.
 
     Returns:
-        Tuple of (page_num, jpeg_bytes, page_width, page_height).
+        Tuple of (image_stream, image_width, image_height, page_width, page_height).
+    """
+    global _PAGES_RENDERED
+    rendered = _rasterize(_SRC_DOC.load_page(page_num), _OPTIONS)
+    _PAGES_RENDERED += 1
+    if _PAGES_RENDERED % STORE_FLUSH_INTERVAL == 0:
+        fitz.TOOLS.store_shrink(100)
+    return rendered
+
+
+def _deflate_streams(doc: fitz.Document, level: int = 6) -> None:
+    """Flate-compress the non-image streams of a document with libdeflate.
+
+    Streams that are uncompressed or already ``/FlateDecode`` are (re)encoded;
+    a stream is only replaced when that makes it smaller. Image streams are
+    left alone since they already carry their own compression, as are streams
+    with ``/DecodeParms``, whose predictor would no longer match the data.
+
+    Args:
+        doc: Document whose streams are compressed in place.
+        level: libdeflate compression level (1-12).
     """
-    pdf_path_str, page_num, dpi = args
-    doc = fitz.open(pdf_path_str)
-    page = doc.load_page(page_num)
-    pix = page.get_pixmap(dpi=dpi, alpha=False, colorspace=fitz.csGRAY)
-    img_bytes = pix.tobytes("jpeg")
-    width = page.rect.width
-    height = page.rect.height
-    doc.close()
-    return page_num, img_bytes, width, height
+    for xref in range(1, doc.xref_length()):
+        if not doc.xref_is_stream(xref) or doc.xref_is_image(xref):
+            continue
+        stream_filter = doc.xref_get_key(xref, "Filter")
+        if stream_filter not in (("null", "null"), ("name", "/FlateDecode")):
+            continue
+        if doc.xref_get_key(xref, "DecodeParms")[0] != "null":
+            continue
+        compressed = deflate.zlib_compress(doc.xref_stream(xref), level)
+        if len(compressed) >= len(doc.xref_stream_raw(xref)):
+            continue
+        doc.update_stream(xref, compressed, compress=False)
+        doc.xref_set_key(xref, "Filter", "/FlateDecode")
+
+
+@lru_cache(maxsize=None)
+def _linearization_supported() -> bool:
+    """Return whether the installed MuPDF can write linearized PDFs.
+
+    MuPDF 1.26 dropped linearization and raises on ``save(linear=True)``, so
+    probe once with a one-page document.
+    """
+    with closing(fitz.open()) as probe:
+        probe.new_page()
+        try:
+            probe.tobytes(linear=True)
+        except Exception:
+            return False
+    return True
+
+
+def _pixmaps_in_background(
+    path: Path, options: _RenderOptions, prefetch: int = 4
+) -> Generator[Tuple[Optional[fitz.Pixmap], float, float, Optional[RenderedPage]], None, None]:
+    """Yield rendered grayscale pixmaps, produced by a background thread.
+
+    MuPDF rendering runs in a producer thread on its own document handle while
+    the caller encodes the previous pages; Pillow releases the GIL while
+    encoding, so the two stages overlap even without multiprocessing.
+
+    Args:
+        path: Path to the source PDF.
+        options: Rendering settings.
+        prefetch: Maximum number of rendered pages waiting to be consumed.
+
+    Yields:
+        Tuples of (pixmap, page_width, page_height, passthrough) in page order.
+        For pages that ``_maybe_passthrough`` accepts, pixmap is None and
+        passthrough holds the finished page.
+    """
+    pixmaps: "queue.Queue" = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def produce() -> None:
+        try:
+            with _open_mapped(path) as doc:
+                put = pixmaps.put
+                for page_num, page in enumerate(doc, 1):
+                    if stop.is_set():
+                        return
+                    rect = page.rect
+                    passthrough = _maybe_passthrough(page, options)
+                    if passthrough is not None:
+                        put((None, rect.width, rect.height, passthrough))
+                        continue
+                    put((_render_pixmap(page, options), rect.width, rect.height, None))
+                    if page_num % STORE_FLUSH_INTERVAL == 0:
+                        fitz.TOOLS.store_shrink(100)
+        except Exception as e:
+            pixmaps.put(e)
+            return
+        pixmaps.put(None)
+
+    producer = threading.Thread(target=produce, name="spool-rasterizer", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = pixmaps.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Unblock the producer if the consumer stopped early
+        stop.set()
+        while producer.is_alive():
+            try:
+                pixmaps.get(timeout=0.05)
+            except queue.Empty:
+                pass
+        producer.join()
 
 
 class DocumentSpoolOptimizer:
@@ -41,19 +562,68 @@ class DocumentSpoolOptimizer:
     benefit from all available CPU cores, then reassembled in the correct order.
     """
 
-    def __init__(self, dpi: int = 100, workers: int = 0):
+    def __init__(
+        self,
+        dpi: int = 100,
+        workers: int = 0,
+        jpeg_quality: int = 55,
+        encoder: str = "pillow",
+        mode: str = "gray",
+        adaptive_dpi: bool = False,
+        libdeflate: bool = False,
+        linearize: bool = False,
+        dedup_streams: bool = False,
+    ):
         """Initialize the optimizer.
 
         Args:
             dpi: Dots per inch for rasterization. Must be between 72 and 300.
                  Lower values produce smaller files; higher values retain more detail.
             workers: Number of worker processes for parallel rendering.
-                     0 (default) means use all logical CPU cores.
+                     0 (default) means use up to 4 logical CPU cores; gains
+                     flatten out beyond 4-6 workers.
                      1 disables multiprocessing and runs sequentially.
+            jpeg_quality: JPEG quality (1-95) for the rasterized pages. Grayscale
+                          notes stay legible well below the usual default of ~95.
+            encoder: JPEG encoder, one of ``ENCODERS``. Falls back to ``"pillow"``
+                     when ``"vips"`` is requested but pyvips is not available.
+            mode: Output mode, one of ``MODES``. ``"bilevel"`` dithers pages to
+                  1 bit and compresses them with CCITT Group 4, which is far
+                  smaller for black-on-white text; ``jpeg_quality`` and
+                  ``encoder`` are then unused.
+            adaptive_dpi: Render pages that contain almost only text at 72 DPI
+                          instead of ``dpi``; pages with significant images or
+                          graphics keep ``dpi``.
+            libdeflate: Compress content streams and fonts with libdeflate
+                        instead of MuPDF's zlib. Ignored with a warning when
+                        the ``deflate`` package is not installed.
+            linearize: Write a linearized ("fast web view") PDF. This adds a
+                       second full pass over the output at save time. Ignored
+                       with a warning when MuPDF no longer supports it.
+            dedup_streams: Hash every stream at save time and merge identical
+                           ones (``garbage=4``). Rasterized pages are almost
+                           never identical, so by default the cheaper
+                           ``garbage=3`` is used.
         """
         self.dpi = dpi
-        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.workers = workers if workers > 0 else min(os.cpu_count() or 1, 4)
+        self.jpeg_quality = jpeg_quality
         self.logger = self._setup_logger()
+        if encoder == "vips" and pyvips is None:
+            self.logger.warning("pyvips is not available, falling back to the Pillow JPEG encoder")
+            encoder = "pillow"
+        self.encoder = encoder
+        self.mode = mode
+        self.adaptive_dpi = adaptive_dpi
+        if libdeflate and deflate is None:
+            self.logger.warning("deflate is not available, falling back to MuPDF's zlib compression")
+            libdeflate = False
+        self.libdeflate = libdeflate
+        if linearize and not _linearization_supported():
+            self.logger.warning("This MuPDF version cannot linearize PDFs, saving without linearization")
+            linearize = False
+        self.linearize = linearize
+        self.dedup_streams = dedup_streams
 
     @staticmethod
     def _setup_logger() -> logging.Logger:
@@ -86,85 +656,38 @@ class DocumentSpoolOptimizer:
         Returns:
             True on success, False if the input file is missing or any error occurs.
         """
-        if not input_path.exists():
+        try:
+            orig_size = os.stat(input_path).st_size
+        except OSError:  # missing, or a path component is not a directory
             self.logger.error("Input file does not exist: %s", input_path)
             return False
 
         start_time = time.time()
-        self.logger.info("Starting optimization for: %s at %d DPI (Grayscale)", input_path.name, self.dpi)
+        self.logger.info(
+            "Starting optimization for: %s at %d DPI (%s)",
+            input_path.name, self.dpi, "Bilevel" if self.mode == "bilevel" else "Grayscale",
+        )
+        options = _RenderOptions(self.dpi, self.jpeg_quality, self.encoder, self.mode, self.adaptive_dpi)
 
         try:
-            # Attempt to open the PDF and perform validation checks
-            src_doc = fitz.open(input_path)
-            
-            # Check if the PDF is encrypted/password-protected
-            if src_doc.is_encrypted:
-                self.logger.error("PDF is password-protected: %s", input_path.name)
-                src_doc.close()
-                return False
-            
-            # Check if the PDF has pages (detect corrupted/empty files)
-            total_pages = len(src_doc)
-            if total_pages == 0:
-                self.logger.error("PDF has no pages or is corrupted: %s", input_path.name)
-                src_doc.close()
+            with _open_mapped(input_path) as src_doc:
+                total_pages = self._validate_source(src_doc, input_path)
+            if not total_pages:
                 return False
-            
-            self.logger.info("Total pages to process: %d", total_pages)
-            
-            # Validate that at least the first page can be loaded and rendered
-            try:
-                first_page = src_doc.load_page(0)
-                first_page.get_pixmap(dpi=self.dpi, alpha=False, colorspace=fitz.csGRAY)
-                self.logger.info("Validation passed: First page rendered successfully")
-            except Exception as e:
-                self.logger.error("Content stream corruption - cannot render pages: %s - %s", input_path.name, str(e))
-                src_doc.close()
-                return False
-            
-            src_doc.close()
-            
-            # Use multiprocessing for parallel page rendering
-            pdf_path_str = str(input_path.absolute())
-            tasks = [(pdf_path_str, page_num, self.dpi) for page_num in range(total_pages)]
-            
-            rendered_pages = {}
-            
-            if self.workers == 1:
-                # Sequential processing
-                for page_num in range(total_pages):
-                    page_num_result, img_bytes, width, height = _render_page((pdf_path_str, page_num, self.dpi))
-                    rendered_pages[page_num_result] = (img_bytes, width, height)
-                    if (page_num + 1) % 10 == 0:
-                        self.logger.info("Processed %d/%d pages...", page_num + 1, total_pages)
-            else:
-                # Parallel processing
-                with ProcessPoolExecutor(max_workers=self.workers) as executor:
-                    futures = {executor.submit(_render_page, task): task[1] for task in tasks}
-                    
-                    for future in as_completed(futures):
-                        page_num, img_bytes, width, height = future.result()
-                        rendered_pages[page_num] = (img_bytes, width, height)
-                        
-                        if len(rendered_pages) % 10 == 0:
-                            self.logger.info("Processed %d/%d pages...", len(rendered_pages), total_pages)
-            
-            # Assemble rendered pages into output PDF
-            out_doc = fitz.open()
-            for page_num in range(total_pages):
-                img_bytes, width, height = rendered_pages[page_num]
-                out_page = out_doc.new_page(width=width, height=height)
-                out_page.insert_image(out_page.rect, stream=img_bytes)
 
-            out_doc.save(output_path, garbage=4, deflate=True, clean=True)
-            out_doc.close()
+            out_doc = fitz.open()
+            try:
+                self._render_pages(input_path, options, total_pages, out_doc)
+                self._finalize(out_doc, output_path)
+            finally:
+                out_doc.close()
 
             elapsed_time = time.time() - start_time
             self.logger.info(
                 "Optimization complete. Saved to: %s. Time taken: %.2fs",
                 output_path.name, elapsed_time,
             )
-            self._log_compression_ratio(input_path, output_path)
+            self._log_compression_ratio(orig_size, output_path)
             return True
 
         except fitz.FileDataError as e:
@@ -197,21 +720,132 @@ class DocumentSpoolOptimizer:
             self.logger.error("Failed to process document: %s - %s", input_path.name, str(e), exc_info=True)
             return False
 
-    def _log_compression_ratio(self, original: Path, optimized: Path) -> None:
+    def _validate_source(self, src_doc: fitz.Document, input_path: Path) -> int:
+        """Check that the source PDF can be processed.
+
+        Args:
+            src_doc: The opened source document.
+            input_path: Path to the source PDF, used for log messages.
+
+        Returns:
+            The number of pages, or 0 if the document is encrypted, empty, or its
+            first page cannot be rendered (the reason is logged).
+        """
+        # Check if the PDF is encrypted/password-protected
+        if src_doc.is_encrypted:
+            self.logger.error("PDF is password-protected: %s", input_path.name)
+            return 0
+
+        # Check if the PDF has pages (detect corrupted/empty files)
+        total_pages = len(src_doc)
+        if total_pages == 0:
+            self.logger.error("PDF has no pages or is corrupted: %s", input_path.name)
+            return 0
+
+        self.logger.info("Total pages to process: %d", total_pages)
+
+        # Validate that at least the first page can be loaded and rendered
+        try:
+            first_page = src_doc.load_page(0)
+            first_page.get_pixmap(dpi=self.dpi, alpha=False, colorspace=fitz.csGRAY)
+            self.logger.info("Validation passed: First page rendered successfully")
+        except Exception as e:
+            self.logger.error("Content stream corruption - cannot render pages: %s - %s", input_path.name, str(e))
+            return 0
+        return total_pages
+
+    def _render_pages(
+        self, input_path: Path, options: _RenderOptions, total_pages: int, out_doc: fitz.Document
+    ) -> None:
+        """Render every source page and append it to the output document.
+
+        Args:
+            input_path: Path to the source PDF.
+            options: Rendering settings.
+            total_pages: Number of pages in the source PDF.
+            out_doc: The output document being built.
+        """
+        if self.workers == 1:
+            # Single process: render in a background thread, encode here
+            with closing(_pixmaps_in_background(input_path, options)) as pixmaps:
+                pages = (
+                    passthrough
+                    or (_encode_page(pix, options), pix.width, pix.height, width, height)
+                    for pix, width, height, passthrough in pixmaps
+                )
+                self._assemble(out_doc, pages, total_pages)
+        else:
+            # Parallel processing; map() yields results in page order
+            pdf_path_str = str(input_path.absolute())
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(pdf_path_str, options),
+            ) as executor:
+                pages = executor.map(_render_page, range(total_pages), chunksize=4)
+                self._assemble(out_doc, pages, total_pages)
+
+    def _finalize(self, out_doc: fitz.Document, output_path: Path) -> None:
+        """Compress and write the output document.
+
+        Args:
+            out_doc: The fully assembled output document.
+            output_path: Destination path for the optimized PDF.
+        """
+        if self.libdeflate:
+            _deflate_streams(out_doc)
+
+        # Image streams are already compressed; only flate content streams and
+        # fonts. With libdeflate that has been done already, and cleaning would
+        # rewrite the content streams uncompressed. Saving straight to the path
+        # lets MuPDF stream the file out; tobytes() would hold a second copy of
+        # the whole output in memory for no measurable gain in write time.
+        # garbage=4 additionally hashes every stream to merge duplicates, which
+        # costs O(total bytes) and finds next to nothing among rasterized pages;
+        # linearization rewrites the file anyway, so it gets the full cleanup in
+        # the same pass.
+        out_doc.save(
+            output_path,
+            garbage=4 if self.dedup_streams or self.linearize else 3,
+            deflate=not self.libdeflate,
+            deflate_images=False,
+            deflate_fonts=not self.libdeflate,
+            clean=not self.libdeflate,
+            linear=self.linearize,
+        )
+
+    def _assemble(self, out_doc: fitz.Document, pages: Iterable[RenderedPage], total_pages: int) -> None:
+        """Append rendered pages to the output document in page order.
+
+        Args:
+            out_doc: The output document being built.
+            pages: Rendered pages in page order.
+            total_pages: Total page count, used for progress logging.
+        """
+        # Emit at most ~20 progress lines regardless of document size
+        log_every = max(10, total_pages // 20) if self.logger.isEnabledFor(logging.INFO) else 0
+        contents_cache: Dict[Tuple[float, float], int] = {}
+        mode = self.mode
+        for page_num, page in enumerate(pages):
+            _append_image_page(out_doc, page, mode, contents_cache)
+            if log_every and (page_num + 1) % log_every == 0:
+                self.logger.info("Processed %d/%d pages...", page_num + 1, total_pages)
+
+    def _log_compression_ratio(self, orig_size: int, optimized: Path) -> None:
         """Log the size comparison between the original and optimized PDF files.
 
         Args:
-            original: Path to the original input PDF.
+            orig_size: Size in bytes of the original input PDF, as captured when
+                       processing started.
             optimized: Path to the newly written output PDF.
         """
-        orig_size_mb = original.stat().st_size / (1024 * 1024)
-        opt_size_mb = optimized.stat().st_size / (1024 * 1024)
-        
-        self.logger.info("Original Size: %.2f MB", orig_size_mb)
-        self.logger.info("Optimized Size: %.2f MB", opt_size_mb)
-        
-        if orig_size_mb > 0:
-            ratio = (opt_size_mb / orig_size_mb) * 100
+        opt_size = os.stat(optimized).st_size
+
+        self.logger.info("Original Size: %.2f MB", orig_size / (1024 * 1024))
+        self.logger.info("Optimized Size: %.2f MB", opt_size / (1024 * 1024))
+
+        if orig_size > 0:
+            ratio = (opt_size / orig_size) * 100
             self.logger.info("Output is %.2f%% of original size.", ratio)
 
 
@@ -225,7 +859,35 @@ def main() -> None:
     parser.add_argument("--dpi", type=int, default=100, help="Rasterization DPI (default: 100).")
     parser.add_argument(
         "--workers", type=int, default=0,
-        help="Worker processes for parallel rendering (default: 0 = all CPU cores).",
+        help="Worker processes for parallel rendering (default: 0 = up to 4 CPU cores).",
+    )
+    parser.add_argument(
+        "--jpeg-quality", type=int, default=55,
+        help="JPEG quality for rasterized pages, 1-95 (default: 55).",
+    )
+    parser.add_argument(
+        "--encoder", choices=ENCODERS, default="pillow",
+        help="JPEG encoder for rasterized pages; 'vips' requires pyvips (default: pillow).",
+    )
+    parser.add_argument(
+        "--mode", choices=MODES, default="gray",
+        help="Output mode: 8-bit grayscale JPEG, or 1-bit dithered CCITT G4 for text notes (default: gray).",
+    )
+    parser.add_argument(
+        "--adaptive-dpi", action="store_true",
+        help="Render text-only pages at 72 DPI; pages with images or graphics keep --dpi.",
+    )
+    parser.add_argument(
+        "--libdeflate", action="store_true",
+        help="Compress content streams with libdeflate instead of zlib; requires the 'deflate' package.",
+    )
+    parser.add_argument(
+        "--linearize", action="store_true",
+        help="Write a linearized (fast web view) PDF; adds a second full pass at save time.",
+    )
+    parser.add_argument(
+        "--dedup-streams", action="store_true",
+        help="Merge byte-identical streams at save time (garbage=4); rarely helps rasterized pages.",
     )
 
     args = parser.parse_args()
@@ -242,7 +904,33 @@ def main() -> None:
         print(f"Error: --workers must be 0 or a positive integer, got {args.workers}", file=sys.stderr)
         sys.exit(1)
 
-    optimizer = DocumentSpoolOptimizer(dpi=args.dpi, workers=args.workers)
+    if args.jpeg_quality < 1 or args.jpeg_quality > 95:
+        print(f"Error: --jpeg-quality must be between 1 and 95, got {args.jpeg_quality}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.encoder == "vips" and pyvips is None:
+        print("Error: --encoder vips requires pyvips (pip install pyvips)", file=sys.stderr)
+        sys.exit(1)
+
+    if args.libdeflate and deflate is None:
+        print("Error: --libdeflate requires the deflate package (pip install deflate)", file=sys.stderr)
+        sys.exit(1)
+
+    if args.linearize and not _linearization_supported():
+        print(f"Error: --linearize is not supported by MuPDF {fitz.VersionFitz}", file=sys.stderr)
+        sys.exit(1)
+
+    optimizer = DocumentSpoolOptimizer(
+        dpi=args.dpi,
+        workers=args.workers,
+        jpeg_quality=args.jpeg_quality,
+        encoder=args.encoder,
+        mode=args.mode,
+        adaptive_dpi=args.adaptive_dpi,
+        libdeflate=args.libdeflate,
+        linearize=args.linearize,
+        dedup_streams=args.dedup_streams,
+    )
     success = optimizer.process_document(args.input, args.output)
 
     if not success:
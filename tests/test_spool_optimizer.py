@@ -0,0 +1,134 @@
+"""Tests for the PDF spool optimizer."""
+
+import io
+from pathlib import Path
+
+import fitz
+import pytest
+from PIL import Image
+
+import spool_optimizer
+from spool_optimizer import DocumentSpoolOptimizer
+
+
+def _jpeg(width: int, height: int) -> bytes:
+    """Return a grayscale JPEG with a simple gradient."""
+    img = Image.linear_gradient("L").resize((width, height))
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=80)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def notes_pdf(tmp_path: Path) -> Path:
+    """A three-page PDF with text on every page and an image on one."""
+    path = tmp_path / "notes.pdf"
+    doc = fitz.open()
+    for i in range(3):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Lecture notes, page {i + 1}", fontsize=14)
+    doc[1].insert_image(fitz.Rect(72, 100, 300, 300), stream=_jpeg(400, 350))
+    doc.save(path)
+    doc.close()
+    return path
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_page_images_are_not_flate_compressed(notes_pdf: Path, tmp_path: Path, workers: int):
+    output = tmp_path / "out.pdf"
+    assert DocumentSpoolOptimizer(workers=workers).process_document(notes_pdf, output)
+
+    with fitz.open(output) as doc:
+        assert len(doc) == 3
+        for page in doc:
+            images = page.get_images(full=True)
+            assert len(images) == 1
+            assert doc.xref_get_key(images[0][0], "Filter") == ("name", "/DCTDecode")
+
+
+def test_bilevel_page_images_use_ccitt(notes_pdf: Path, tmp_path: Path):
+    output = tmp_path / "out.pdf"
+    assert DocumentSpoolOptimizer(workers=1, mode="bilevel").process_document(notes_pdf, output)
+
+    with fitz.open(output) as doc:
+        for page in doc:
+            xref = page.get_images(full=True)[0][0]
+            assert doc.xref_get_key(xref, "Filter") == ("name", "/CCITTFaxDecode")
+            assert page.get_pixmap(dpi=20).width > 0
+
+
+def _scan_page(doc: fitz.Document) -> fitz.Page:
+    """Append a letter-size page that is a single full-page grayscale JPEG."""
+    page = doc.new_page(width=612, height=792)
+    page.insert_image(page.rect, stream=_jpeg(850, 1100), keep_proportion=False)
+    return page
+
+
+def test_full_page_scan_is_passed_through():
+    doc = fitz.open()
+    page = _scan_page(doc)
+    options = spool_optimizer._RenderOptions(100, 55, "pillow", "gray", False)
+    assert spool_optimizer._maybe_passthrough(page, options) is not None
+
+
+def test_clipped_scan_is_rendered():
+    doc = fitz.open()
+    page = _scan_page(doc)
+    xref = page.get_contents()[0]
+    doc.update_stream(xref, b"q 0 0 306 396 re W n " + doc.xref_stream(xref) + b" Q")
+    options = spool_optimizer._RenderOptions(100, 55, "pillow", "gray", False)
+    assert spool_optimizer._maybe_passthrough(doc[0], options) is None
+
+
+@pytest.mark.parametrize("rotation", [0, 90, 180, 270])
+def test_adaptive_dpi_keeps_dpi_for_image_heavy_rotated_pages(rotation: int):
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)
+    page.insert_text((72, 72), "A short caption")
+    noise = Image.effect_noise((400, 200), 64)
+    buf = io.BytesIO()
+    noise.save(buf, "PNG")
+    page.insert_image(fitz.Rect(50, 600, 545, 842), stream=buf.getvalue(), keep_proportion=False)
+    page.set_rotation(rotation)
+    assert spool_optimizer._choose_dpi(doc[0], 100) == 100
+
+
+def test_adaptive_dpi_lowers_dpi_for_text_pages(notes_pdf: Path):
+    with fitz.open(notes_pdf) as doc:
+        assert spool_optimizer._choose_dpi(doc[0], 150) == spool_optimizer.ADAPTIVE_TEXT_DPI
+
+
+def test_libdeflate_keeps_predictor_streams_intact():
+    pytest.importorskip("deflate")
+    import zlib
+
+    doc = fitz.open()
+    doc.new_page()
+    rows = b"".join(b"\x00" + bytes([i, i, i, i]) for i in range(64))
+    xref = doc.get_new_xref()
+    doc.update_object(xref, "<<>>")
+    doc.update_stream(xref, zlib.compress(rows, 0), compress=False)
+    doc.xref_set_key(xref, "Filter", "/FlateDecode")
+    doc.xref_set_key(xref, "DecodeParms", "<</Predictor 12/Columns 4>>")
+    raw = doc.xref_stream_raw(xref)
+
+    spool_optimizer._deflate_streams(doc)
+    assert doc.xref_stream_raw(xref) == raw
+    assert doc.xref_get_key(xref, "DecodeParms")[0] == "dict"
+    assert doc.xref_stream(xref) == bytes(i for i in range(64) for _ in range(4))
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_directory_input_is_rejected(tmp_path: Path, workers: int):
+    with pytest.raises(fitz.FileDataError):
+        spool_optimizer._map_file(str(tmp_path))
+    assert not DocumentSpoolOptimizer(workers=workers).process_document(tmp_path, tmp_path / "out.pdf")
+
+
+def test_unreadable_input_is_rejected(notes_pdf: Path, monkeypatch: pytest.MonkeyPatch):
+    def deny(*args, **kwargs):
+        raise PermissionError(13, "Permission denied")
+
+    monkeypatch.setattr(spool_optimizer.os, "open", deny)
+    with pytest.raises(fitz.FileDataError):
+        spool_optimizer._map_file(str(notes_pdf))